@@ -8,6 +8,7 @@ from dotenv import load_dotenv
 
 # from fastapi import FastAPI
 from fastapi import HTTPException, FastAPI
+from prometheus_client import Counter
 from prometheus_fastapi_instrumentator import Instrumentator
 from jurispacy_tokenizer import JuriSpacyTokenizer
 from juritools.juriloss import JuriLoss
@@ -15,6 +16,10 @@ from juritools.predict import load_ner_model
 import config
 
 from utils import (
+    RecordingTokenizer,
+    SingleFlight,
+    TTLCache,
+    get_decision_hash,
     get_juritools_info,
     process_ner,
 )
@@ -47,6 +52,15 @@ app = FastAPI(
 )
 
 instrumentator = Instrumentator().instrument(app).expose(app)
+coalesced_requests = Counter(
+    "ner_coalesced_requests_total",
+    "Number of /ner requests served by an identical in-flight request",
+)
+ner_single_flight = SingleFlight()
+reused_ner_states = Counter(
+    "loss_reused_ner_state_total",
+    "Number of /loss requests reusing the state retained from /ner",
+)
 app = add_custom_logger(
     app=app,
     custom_error_logger=log_error,
@@ -91,15 +105,27 @@ async def package_info():
 def handler(decision: Decision):
     """Returns the tagged entities of the decision"""
 
-    # Check if the endpoint is busy
-    if config.processing_request:
-        raise HTTPException(
-            status_code=429,
-            detail="Pseudonymisation in progress, endpoint is busy",
-        )
-    config.processing_request = True
-    result = process_ner(decision, tokenizer, model)
-    config.processing_request = False
+    def run_ner():
+        # Check if the endpoint is busy
+        if config.processing_request:
+            raise HTTPException(
+                status_code=429,
+                detail="Pseudonymisation in progress, endpoint is busy",
+            )
+        config.processing_request = True
+        if ner_state_store.maxsize > 0:
+            memo = {}
+            result = process_ner(decision, RecordingTokenizer(tokenizer, memo), model)
+            ner_state_store.set(decision.idDecision, memo)
+        else:
+            result = process_ner(decision, tokenizer, model)
+        config.processing_request = False
+        return result
+
+    # Identical requests already in progress share their result
+    result, shared = ner_single_flight.do(get_decision_hash(decision), run_ner)
+    if shared:
+        coalesced_requests.inc()
 
     return NERResponse(**result)
 
@@ -107,6 +133,17 @@ def handler(decision: Decision):
 @app.post("/loss")
 async def loss(json_treatment: dict):
     """Returns the loss of a user treatment"""
+    # Reuse the tokenization done by /ner on the same document,
+    # texts that differ from the stored ones are tokenized again
+    memo = ner_state_store.get(json_treatment.get("idDecision"))
+    if memo is not None:
+        document_tokenizer = RecordingTokenizer(tokenizer, memo, read_only=True)
+        juriloss = JuriLoss(json_treatment, model=model, tokenizer=document_tokenizer)
+        document_loss = juriloss.get_document_loss()
+        if document_tokenizer.hits:
+            reused_ner_states.inc()
+        return document_loss
+
     juriloss = JuriLoss(json_treatment, model=model, tokenizer=tokenizer)
     return juriloss.get_document_loss()
 
@@ -139,3 +176,9 @@ else:
     raise EnvironmentError("MODEL_JURICA is not set")
 # Load the tokenizer
 tokenizer = JuriSpacyTokenizer()
+
+# Tokenization retained from /ner for /loss, disabled unless a size is given
+ner_state_store = TTLCache(
+    maxsize=int(os.environ.get("NER_STATE_CACHE_SIZE", 0)),
+    ttl=float(os.environ.get("NER_STATE_CACHE_TTL", 3600)),
+)
@@ -0,0 +1,122 @@
+"""Benchmark of the /ner endpoint for several partitions of the CPUs among workers
+
+Each configuration starts `server.py`, sends the same decisions with a fixed
+concurrency, retrying the requests answered with a 429, and reports the
+throughput and latencies. `MODEL_JURICA` must point to a model.
+
+    python bench_topology.py --workers 1 2 4 --requests 200 --concurrency 8
+"""
+import sys
+import time
+import asyncio
+import statistics
+import subprocess
+
+import httpx
+
+TEXT = (
+    "Pierre Dupont est ingénieur. "
+    "Il est content de vivre à Nantes. "
+    "Il travaille au tribunal de Paris. "
+    "Il habite au 64 rue de Strasbourg 92400 Courbevoie. "
+    "Il est hospitalisé à la clinique des Anges. "
+    "Son compte bancaire est le 44437543. "
+) * 20
+
+
+def start_server(port: int, workers: int, topology: bool) -> subprocess.Popen:
+    command = [sys.executable, "server.py", "-p", str(port)]
+    if topology:
+        command += ["--topology", "--workers", str(workers)]
+    server = subprocess.Popen(command)
+
+    while True:
+        if server.poll() is not None:
+            raise RuntimeError("The server stopped before being ready")
+        try:
+            httpx.get(f"http://localhost:{port}/").raise_for_status()
+            return server
+        except httpx.HTTPError:
+            time.sleep(1)
+
+
+async def send(client: httpx.AsyncClient, index: int) -> tuple[float, int]:
+    """Send a decision until it is accepted, returns its latency and the number of 429"""
+    decision = {
+        "idLabel": "bench",
+        "idDecision": f"bench-{index}",
+        "sourceId": index,
+        "sourceName": "jurica",
+        "text": TEXT,
+    }
+    rejected = 0
+    start = time.perf_counter()
+    while True:
+        response = await client.post("/ner", json=decision)
+        if response.status_code != 429:
+            response.raise_for_status()
+            return time.perf_counter() - start, rejected
+        rejected += 1
+        await asyncio.sleep(0.01)
+
+
+async def run(port: int, requests: int, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(client, index):
+        async with semaphore:
+            return await send(client, index)
+
+    async with httpx.AsyncClient(base_url=f"http://localhost:{port}", timeout=None) as client:
+        # Warm up every worker
+        await asyncio.gather(*(send(client, -index) for index in range(1, concurrency + 1)))
+        start = time.perf_counter()
+        results = await asyncio.gather(*(limited(client, index) for index in range(requests)))
+        elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for latency, _ in results)
+    return {
+        "throughput": requests / elapsed,
+        "p50": statistics.median(latencies),
+        "p95": latencies[int(0.95 * (len(latencies) - 1))],
+        "p99": latencies[int(0.99 * (len(latencies) - 1))],
+        "rejected": sum(rejected for _, rejected in results),
+    }
+
+
+def main():
+    from argparse import ArgumentParser
+
+    argument_parser = ArgumentParser()
+    argument_parser.add_argument(
+        "-w", "--workers",
+        default=[1, 2, 4],
+        help="Numbers of pinned workers to compare",
+        nargs="+",
+        type=int,
+    )
+    argument_parser.add_argument("-n", "--requests", default=100, type=int)
+    argument_parser.add_argument("-c", "--concurrency", default=8, type=int)
+    argument_parser.add_argument("-p", "--port", default=8090, type=int)
+    arguments = argument_parser.parse_args()
+
+    configurations = [("default", 1, False)] + [
+        (f"topology x{workers}", workers, True) for workers in arguments.workers
+    ]
+
+    print(f"{'configuration':<16}{'req/s':>10}{'p50 (s)':>10}{'p95 (s)':>10}{'p99 (s)':>10}{'429':>8}")
+    for name, workers, topology in configurations:
+        server = start_server(arguments.port, workers, topology)
+        try:
+            result = asyncio.run(run(arguments.port, arguments.requests, arguments.concurrency))
+        finally:
+            server.terminate()
+            server.wait()
+        print(
+            f"{name:<16}{result['throughput']:>10.2f}{result['p50']:>10.3f}"
+            f"{result['p95']:>10.3f}{result['p99']:>10.3f}{result['rejected']:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,14 @@
+import logging
+import sys
+
+# Kept free of heavy imports: the supervisor of the topology workers logs
+# through it without loading torch or the model.
+
+formatter = logging.Formatter("%(message)s")
+
+logger = logging.getLogger("nlp-api")
+standard_output_handler = logging.StreamHandler(stream=sys.stdout)
+standard_output_handler.setFormatter(formatter)
+logger.addHandler(standard_output_handler)
+logger.propagate = False
+logger.setLevel(logging.INFO)
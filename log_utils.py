@@ -3,9 +3,9 @@ from starlette.background import BackgroundTask
 from starlette.types import Message
 import logging
 import json
-import sys
 from datetime import datetime, timezone
 from utils import get_juritools_info
+from log_config import logger
 
 
 async def set_body(request: Request, body: bytes):
@@ -100,16 +100,6 @@ def add_custom_logger(
     return app
 
 
-formatter = logging.Formatter("%(message)s")
-
-logger = logging.getLogger("nlp-api")
-standard_output_handler = logging.StreamHandler(stream=sys.stdout)
-standard_output_handler.setFormatter(formatter)
-logger.addHandler(standard_output_handler)
-logger.propagate = False
-logger.setLevel(logging.INFO)
-
-
 def log_error(
     error_message: str,
     request_url: str,
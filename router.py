@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import time
+import asyncio
+import bisect
+import hashlib
+from http import HTTPStatus
+
+import httpx
+from fastapi import FastAPI, Request, Response
+
+
+ROUTED_ENDPOINTS = ("/ner", "/loss")
+
+
+def _hash(value: str) -> int:
+    return int(hashlib.md5(value.encode("utf-8")).hexdigest(), 16)
+
+
+class HashRing:
+    """Consistent hash ring placing each node at several virtual positions"""
+
+    def __init__(self, nodes: list[str], replicas: int = 100):
+        self._ring = sorted(
+            (_hash(f"{node}#{replica}"), node) for node in nodes for replica in range(replicas)
+        )
+        self._positions = [position for position, _ in self._ring]
+        self.nodes = list(dict.fromkeys(nodes))
+
+    def iter_nodes(self, key: str):
+        """Yields every node once, starting from the owner of `key` and going clockwise"""
+        if not self._ring:
+            return
+        start = bisect.bisect(self._positions, _hash(key)) % len(self._ring)
+        seen = set()
+        for index in range(len(self._ring)):
+            node = self._ring[(start + index) % len(self._ring)][1]
+            if node not in seen:
+                seen.add(node)
+                yield node
+                if len(seen) == len(self.nodes):
+                    return
+
+
+class Node:
+    """API replica reachable through an HTTP client"""
+
+    def __init__(self, name: str, client: httpx.AsyncClient):
+        self.name = name
+        self.client = client
+        self.in_flight: dict[str, int] = {}
+        self.unhealthy_until = 0.0
+        self.probe_failed = False
+        self.checked = False
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(self.in_flight.values())
+
+    @property
+    def healthy(self) -> bool:
+        return not self.probe_failed and self.unhealthy_until <= time.monotonic()
+
+    def mark_unhealthy(self, cooldown: float):
+        """Skip the replica for `cooldown` seconds after a failed request"""
+        self.checked = True
+        self.unhealthy_until = time.monotonic() + cooldown
+
+    async def probe(self, timeout: float):
+        """Check the health endpoint of the replica
+
+        A failed probe keeps the replica out until a probe succeeds. A successful
+        probe does not end the cooldown of a failed request.
+        """
+        try:
+            response = await asyncio.wait_for(self.client.get("/"), timeout)
+            self.probe_failed = response.status_code != HTTPStatus.OK
+        except (httpx.HTTPError, asyncio.TimeoutError):
+            self.probe_failed = True
+        self.checked = True
+
+
+def get_routing_key(body: bytes) -> str:
+    """Get the key placing a request on the ring: the document id, or a hash of its text"""
+    try:
+        data = json.loads(body)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        data = None
+    if not isinstance(data, dict):
+        return hashlib.sha256(body).hexdigest()
+    if data.get("idDecision"):
+        return str(data["idDecision"])
+    return hashlib.sha256(str(data.get("text", body)).encode("utf-8")).hexdigest()
+
+
+def create_router(
+    nodes: dict[str, httpx.AsyncClient],
+    replicas: int = 100,
+    max_queue_depth: int = 1,
+    cooldown: float = 5.0,
+    health_interval: float = 5.0,
+    health_timeout: float = 2.0,
+) -> FastAPI:
+    """Create an app forwarding /ner and /loss to several API replicas
+
+    Each document is sent to its owner on the hash ring, so that the state kept by
+    a replica for this document is reused. Unhealthy owners, owners already busy
+    with `max_queue_depth` other documents and owners answering 429 are skipped
+    in favour of the next node on the ring. Replicas are known to be unhealthy
+    from the failed requests, for `cooldown` seconds, and from the failed probes
+    of their health endpoint, until a probe succeeds.
+
+    Args:
+        nodes (dict[str, httpx.AsyncClient]): clients to the replicas, by name
+        replicas (int, optional): virtual positions of each node on the ring. Defaults to 100.
+        max_queue_depth (int, optional): requests in flight above which a node is skipped.
+            Defaults to 1.
+        cooldown (float, optional): seconds during which a node is skipped after a failed request.
+            Defaults to 5.0.
+        health_interval (float, optional): seconds between two probes of the replicas,
+            0 disables the probes. Defaults to 5.0.
+        health_timeout (float, optional): seconds after which a probe fails. Defaults to 2.0.
+
+    Returns:
+        FastAPI: the router application
+    """
+    ring = HashRing(list(nodes), replicas=replicas)
+    router_nodes = {name: Node(name, client) for name, client in nodes.items()}
+
+    router = FastAPI(
+        title="Pseudonymisation API router",
+        description="Route requests to the replicas of the pseudonymisation API",
+        version="1.0",
+    )
+    router.state.nodes = router_nodes
+
+    async def probe_nodes():
+        await asyncio.gather(
+            *(node.probe(health_timeout) for node in router_nodes.values())
+        )
+
+    router.state.probe_nodes = probe_nodes
+
+    async def probe_nodes_forever():
+        while True:
+            await probe_nodes()
+            await asyncio.sleep(health_interval)
+
+    @router.on_event("startup")
+    async def start_probes():
+        if health_interval > 0:
+            router.state.probes = asyncio.create_task(probe_nodes_forever())
+
+    @router.on_event("shutdown")
+    async def close_clients():
+        if health_interval > 0:
+            router.state.probes.cancel()
+        for node in router_nodes.values():
+            await node.client.aclose()
+
+    @router.get("/")
+    def index():
+        """Health check."""
+        return {
+            "message": HTTPStatus.OK.phrase,
+            "status-code": HTTPStatus.OK,
+            "nodes": {
+                node.name: {
+                    "healthy": node.healthy,
+                    "checked": node.checked,
+                    "queue_depth": node.queue_depth,
+                }
+                for node in router_nodes.values()
+            },
+        }
+
+    def candidates(key: str) -> list[Node]:
+        """Ring order, with nodes able to take the request right away first"""
+        available, busy = [], []
+        for name in ring.iter_nodes(key):
+            node = router_nodes[name]
+            if not node.healthy:
+                continue
+            # A node already working on this document may coalesce the request
+            if node.queue_depth < max_queue_depth or key in node.in_flight:
+                available.append(node)
+            else:
+                busy.append(node)
+        return available + busy
+
+    async def forward(node: Node, key: str, request: Request, body: bytes) -> httpx.Response:
+        node.in_flight[key] = node.in_flight.get(key, 0) + 1
+        try:
+            return await node.client.post(
+                request.url.path,
+                content=body,
+                params=request.query_params,
+                headers={"content-type": request.headers.get("content-type", "application/json")},
+            )
+        finally:
+            node.in_flight[key] -= 1
+            if not node.in_flight[key]:
+                del node.in_flight[key]
+
+    async def route(request: Request):
+        body = await request.body()
+        key = get_routing_key(body)
+
+        response = None
+        for node in candidates(key):
+            try:
+                response = await forward(node, key, request, body)
+            except httpx.TransportError:
+                node.mark_unhealthy(cooldown)
+                continue
+            if response.status_code != HTTPStatus.TOO_MANY_REQUESTS:
+                break
+
+        if response is None:
+            return Response(
+                content=json.dumps({"detail": "No API node available"}),
+                status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+                media_type="application/json",
+            )
+        return Response(
+            content=response.content,
+            status_code=response.status_code,
+            media_type=response.headers.get("content-type"),
+        )
+
+    for endpoint in ROUTED_ENDPOINTS:
+        router.add_api_route(endpoint, route, methods=["POST"])
+
+    return router
+
+
+def create_router_from_env() -> FastAPI:
+    """Create the router for the replicas listed in the `ROUTER_NODES` environment variable"""
+    urls = [url.strip() for url in os.environ.get("ROUTER_NODES", "").split(",") if url.strip()]
+    if not urls:
+        raise EnvironmentError("ROUTER_NODES is not set")
+    # NER may take long to answer, but a replica that does not accept connections is skipped
+    connect_timeout = float(os.environ.get("ROUTER_CONNECT_TIMEOUT", 5.0))
+    timeout = httpx.Timeout(None, connect=connect_timeout, pool=connect_timeout)
+    return create_router(
+        {url: httpx.AsyncClient(base_url=url, timeout=timeout) for url in urls},
+        max_queue_depth=int(os.environ.get("ROUTER_MAX_QUEUE_DEPTH", 1)),
+        cooldown=float(os.environ.get("ROUTER_COOLDOWN", 5.0)),
+        health_interval=float(os.environ.get("ROUTER_HEALTH_INTERVAL", 5.0)),
+        health_timeout=float(os.environ.get("ROUTER_HEALTH_TIMEOUT", 2.0)),
+    )
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    import uvicorn
+    from dotenv import load_dotenv
+
+    load_dotenv()
+
+    argument_parser = ArgumentParser()
+
+    argument_parser.add_argument(
+        "-a", "--address",
+        default="0.0.0.0",
+        help="Host for the router",
+    )
+    argument_parser.add_argument(
+        "-p", "--port",
+        default=8080,
+        help="Port for the router",
+        type=int,
+    )
+    argument_parser.add_argument(
+        "-n", "--node",
+        action="append",
+        help="URL of an API replica, can be repeated. Defaults to ROUTER_NODES",
+    )
+    argument_parser.add_argument(
+        "-l", "--log-level",
+        default="error",
+        help="Log level"
+    )
+
+    arguments = argument_parser.parse_args()
+
+    if arguments.node:
+        os.environ["ROUTER_NODES"] = ",".join(arguments.node)
+
+    uvicorn.run(
+        "router:create_router_from_env",
+        factory=True,
+        host=arguments.address,
+        port=arguments.port,
+        log_level=arguments.log_level,
+    )
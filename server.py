@@ -1,5 +1,93 @@
+import os
+import json
+import signal
+import multiprocessing
+from multiprocessing.connection import wait
+from datetime import datetime, timezone
+
 import uvicorn
-from app import app # noqa
+from log_config import logger
+from topology import get_available_cpus, get_thread_environment, partition_cpus, pin_worker
+
+# Topology workers re-import this module when they start: the app, torch and
+# spaCy must only be imported once they are pinned.
+
+
+def log_topology(msg: str, data: dict, error: bool = False):
+    message = json.dumps(
+        {
+            "operationName": "NLP-API",
+            "msg": msg,
+            "data": {"datetime": str(datetime.now(timezone.utc)), **data},
+        }
+    )
+    if error:
+        logger.error(message)
+    else:
+        logger.info(message)
+
+
+def run_worker(config: uvicorn.Config, sockets: list, worker: int, cpus: list[int]):
+    """Serve the app in a worker pinned to `cpus`"""
+    layout = pin_worker(cpus)
+    log_topology("Worker layout", {"worker": worker, **layout})
+    # The app is only loaded by the server, once the worker is pinned
+    uvicorn.Server(config=config).run(sockets=sockets)
+
+
+def run_topology(config: uvicorn.Config, workers: int) -> int:
+    """Serve the app in `workers` processes, each pinned to its own share of the CPUs
+
+    Returns:
+        int: exit code, 1 if a worker stopped unexpectedly
+    """
+    cpus = get_available_cpus()
+    partitions = partition_cpus(cpus, workers)
+
+    sockets = [config.bind_socket()]
+    # Spawned workers start their thread pools with the environment they were created with
+    context = multiprocessing.get_context("spawn")
+    processes = {}
+    environment = dict(os.environ)
+    for worker, worker_cpus in enumerate(partitions):
+        os.environ.update(get_thread_environment(worker_cpus))
+        process = context.Process(
+            target=run_worker,
+            args=(config, sockets, worker, worker_cpus),
+        )
+        process.start()
+        processes[process.sentinel] = (worker, process)
+    os.environ.clear()
+    os.environ.update(environment)
+
+    log_topology("Topology layout", {"cpus": cpus, "partitions": partitions})
+
+    stopping = False
+
+    def stop(*args):
+        nonlocal stopping
+        stopping = True
+        for _, process in processes.values():
+            process.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    exit_code = 0
+    while processes:
+        for sentinel in wait(list(processes)):
+            worker, process = processes.pop(sentinel)
+            process.join()
+            if not stopping:
+                log_topology(
+                    "Worker stopped unexpectedly",
+                    {"worker": worker, "pid": process.pid, "exitcode": process.exitcode},
+                    error=True,
+                )
+                exit_code = 1
+                stop()
+    return exit_code
+
 
 if __name__ == "__main__":
     from argparse import ArgumentParser
@@ -29,13 +117,41 @@ if __name__ == "__main__":
         default="error",
         help="Log level"
     )
+    argument_parser.add_argument(
+        "-t", "--topology",
+        help="Split the CPUs among the workers and pin each worker to its share",
+        action="store_true",
+    )
+    argument_parser.add_argument(
+        "-w", "--workers",
+        default=1,
+        help="Number of inference workers in topology mode",
+        type=int,
+    )
 
     arguments = argument_parser.parse_args()
 
-    uvicorn.run(
-        "app:app",
-        host=arguments.address,
-        port=arguments.port,
-        log_level=arguments.log_level,
-        reload=arguments.debug,
-    )
+    if arguments.topology and arguments.debug is True:
+        argument_parser.error("--debug reloads a single process, it cannot be used with --topology")
+
+    if arguments.topology:
+        exit_code = run_topology(
+            uvicorn.Config(
+                "app:app",
+                host=arguments.address,
+                port=arguments.port,
+                log_level=arguments.log_level,
+            ),
+            workers=arguments.workers,
+        )
+        raise SystemExit(exit_code)
+    else:
+        from app import app  # noqa
+
+        uvicorn.run(
+            "app:app",
+            host=arguments.address,
+            port=arguments.port,
+            log_level=arguments.log_level,
+            reload=arguments.debug,
+        )
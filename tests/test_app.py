@@ -1,6 +1,7 @@
 import datetime
 import os
 import re
+import sys
 import asyncio
 
 import pytest
@@ -21,18 +22,28 @@ load_dotenv()
 
 if API_URL := os.environ.get("API_URL"):
     client = Client(base_url=API_URL)
-    async_client = AsyncClient(base_url=API_URL)
+    async_client_kwargs = {"base_url": API_URL}
 else:
     from fastapi.testclient import TestClient
     from app import app
 
+    from utils import TTLCache
+
     client = TestClient(app)
-    async_client = AsyncClient(app=app, base_url="http://test")
+    async_client_kwargs = {"app": app, "base_url": "http://test"}
+
+async_client = AsyncClient(**async_client_kwargs)
 
 
 pytest_plugins = "pytest_asyncio"
 
 
+def get_metric(metrics: str, name: str) -> float:
+    """Read the value of a metric in the Prometheus text format"""
+    match = re.search(rf"^{name} (\S+)$", metrics, flags=re.MULTILINE)
+    return float(match.group(1)) if match else 0.0
+
+
 @pytest.mark.asyncio
 async def test_multiple_call_ner_429():
     async with async_client as ac:
@@ -54,14 +65,14 @@ async def test_multiple_call_ner_429():
         call2 = ac.post(
             "/ner",
             json={
-                "idLabel": "64f5aff6c9bbeeb075448279",
-                "idDecision": "64f5b01596dfe49c47573aca",
-                "sourceId": 2301729,
+                "idLabel": "64f5aff6c9bbeeb075448280",
+                "idDecision": "64f5b01596dfe49c47573acb",
+                "sourceId": 2301730,
                 "sourceName": "jurica",
-                "text": "Pierre Dupont est ingénieur. "
-                "Il est content de vivre à Nantes. "
+                "text": "Paul Martin est avocat. "
+                "Il est content de vivre à Lyon. "
                 "Il travaille au tribunal de Paris. "
-                "Il habite au 64 rue de Strasbourg 92400 Courbevoie. "
+                "Il habite au 12 rue de la Paix 75002 Paris. "
                 "Il est hospitalisé à la clinique des Anges. "
                 "Son compte bancaire es le 44437543.",
             },
@@ -73,6 +84,35 @@ async def test_multiple_call_ner_429():
     assert res2.status_code == 429
 
 
+@pytest.mark.asyncio
+async def test_multiple_call_ner_coalesced():
+    """Identical concurrent requests share the same computation"""
+    decision = {
+        "idLabel": "64f5aff6c9bbeeb075448279",
+        "idDecision": "64f5b01596dfe49c47573aca",
+        "sourceId": 2301729,
+        "sourceName": "jurica",
+        "text": "Pierre Dupont est ingénieur. "
+        "Il est content de vivre à Nantes. "
+        "Il travaille au tribunal de Paris. "
+        "Il habite au 64 rue de Strasbourg 92400 Courbevoie. "
+        "Il est hospitalisé à la clinique des Anges. "
+        "Son compte bancaire es le 44437543.",
+    }
+    async with AsyncClient(**async_client_kwargs) as ac:
+        before = get_metric((await ac.get("/metrics")).text, "ner_coalesced_requests_total")
+        res1, res2 = await asyncio.gather(
+            ac.post("/ner", json=decision),
+            ac.post("/ner", json=decision),
+        )
+        after = get_metric((await ac.get("/metrics")).text, "ner_coalesced_requests_total")
+
+    assert res1.status_code == 200
+    assert res2.status_code == 200
+    assert res1.json() == res2.json()
+    assert after - before == 1
+
+
 def test_ner_bad_meta_formatting():
     """Testing `/ner` endpoint with bad content"""
     response = client.post(
@@ -290,3 +330,49 @@ def test_ner_with_categories_tj():
         ],
         "checklist": [],
     }
+
+
+@pytest.mark.skipif(bool(API_URL), reason="the state store is configured in the app process")
+def test_loss_reuses_ner_state(monkeypatch):
+    """Testing `/loss` after `/ner` on the same decision with the state store enabled"""
+    monkeypatch.setattr(sys.modules["app"], "ner_state_store", TTLCache(maxsize=8, ttl=60))
+    decision = {
+        "idLabel": "64f5aff6c9bbeeb075448279",
+        "idDecision": "64f5b01596dfe49c47573acc",
+        "sourceId": 2301729,
+        "sourceName": "jurica",
+        "text": "Pierre Dupont est ingénieur. Il habite au 77 boulevard Saint-Germain à Paris",  # noqa: E501
+    }
+    treatment = {
+        **decision,
+        "entities": [
+            {
+                "text": "Pierre",
+                "start": 0,
+                "end": 6,
+                "label": "personnePhysique",
+                "source": "NER model",
+                "entityId": "personnePhysique_pierre",
+            },
+            {
+                "text": "Dupont",
+                "start": 7,
+                "end": 13,
+                "label": "personnePhysique",
+                "source": "NER model",
+                "entityId": "personnePhysique_dupont",
+            },
+        ],
+    }
+
+    uncached_loss = client.post("/loss", json=treatment)
+    assert uncached_loss.status_code == 200, uncached_loss.content
+
+    before = get_metric(client.get("/metrics").text, "loss_reused_ner_state_total")
+    assert client.post("/ner", json=decision).status_code == 200
+    cached_loss = client.post("/loss", json=treatment)
+    after = get_metric(client.get("/metrics").text, "loss_reused_ner_state_total")
+
+    assert cached_loss.status_code == 200, cached_loss.content
+    assert after - before == 1
+    assert cached_loss.json() == pytest.approx(uncached_loss.json())
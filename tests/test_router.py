@@ -0,0 +1,258 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import FastAPI, HTTPException
+
+from router import HashRing, create_router, get_routing_key
+
+
+pytest_plugins = "pytest_asyncio"
+
+
+def create_replica(
+    name: str,
+    status_code: int = 200,
+    release: asyncio.Event = None,
+    hang: bool = False,
+) -> FastAPI:
+    """In-process stand-in for an API replica answering with its name"""
+    replica = FastAPI()
+    replica.state.calls = []
+
+    @replica.get("/")
+    async def index():
+        if hang:
+            await asyncio.Event().wait()
+        return {"status-code": 200}
+
+    @replica.post("/ner")
+    async def ner(decision: dict):
+        replica.state.calls.append(decision["idDecision"])
+        if release is not None:
+            await release.wait()
+        if status_code != 200:
+            raise HTTPException(status_code=status_code, detail="busy")
+        return {"node": name}
+
+    @replica.post("/loss")
+    async def loss(treatment: dict):
+        return {"node": name}
+
+    return replica
+
+
+def create_test_router(replicas: dict[str, FastAPI], **kwargs) -> FastAPI:
+    return create_router(
+        {
+            name: httpx.AsyncClient(app=replica, base_url=f"http://{name}")
+            for name, replica in replicas.items()
+        },
+        **kwargs,
+    )
+
+
+def unreachable_client(error: type = httpx.ConnectError) -> httpx.AsyncClient:
+    def refuse(request):
+        raise error("Cannot connect", request=request)
+
+    return httpx.AsyncClient(transport=httpx.MockTransport(refuse), base_url="http://down")
+
+
+def decision(id_decision: str) -> dict:
+    return {"idDecision": id_decision, "text": "Pierre Dupont est ingénieur."}
+
+
+def test_hash_ring_yields_every_node_once():
+    ring = HashRing(["a", "b", "c"])
+    for key in ("1", "2", "3"):
+        assert sorted(ring.iter_nodes(key)) == ["a", "b", "c"]
+
+
+def test_hash_ring_keeps_keys_when_a_node_is_added():
+    keys = [str(index) for index in range(1000)]
+    before = HashRing(["a", "b", "c"])
+    after = HashRing(["a", "b", "c", "d"])
+    moved = [key for key in keys if next(before.iter_nodes(key)) != next(after.iter_nodes(key))]
+
+    assert all(next(after.iter_nodes(key)) == "d" for key in moved)
+    assert len(moved) < len(keys) / 2
+
+
+def test_routing_key():
+    assert get_routing_key(b'{"idDecision": "abc", "text": "x"}') == "abc"
+    assert get_routing_key(b'{"text": "x"}') == get_routing_key(b'{"text": "x", "meta": 1}')
+    assert get_routing_key(b"not json") != get_routing_key(b"other")
+
+
+@pytest.mark.asyncio
+async def test_same_document_goes_to_same_node():
+    replicas = {name: create_replica(name) for name in ("a", "b", "c")}
+    router = create_test_router(replicas)
+
+    async with httpx.AsyncClient(app=router, base_url="http://router") as client:
+        nodes = set()
+        for _ in range(5):
+            response = await client.post("/ner", json=decision("64f5b01596dfe49c47573aca"))
+            assert response.status_code == 200
+            nodes.add(response.json()["node"])
+        loss = await client.post("/loss", json=decision("64f5b01596dfe49c47573aca"))
+
+        spread = {
+            (await client.post("/ner", json=decision(str(index)))).json()["node"]
+            for index in range(50)
+        }
+
+    assert len(nodes) == 1
+    assert loss.json()["node"] in nodes
+    assert spread == {"a", "b", "c"}
+
+
+@pytest.mark.asyncio
+async def test_busy_node_fails_over():
+    replicas = {"a": create_replica("a", status_code=429), "b": create_replica("b")}
+    router = create_test_router(replicas)
+
+    async with httpx.AsyncClient(app=router, base_url="http://router") as client:
+        for index in range(10):
+            response = await client.post("/ner", json=decision(str(index)))
+            assert response.status_code == 200
+            assert response.json()["node"] == "b"
+
+
+@pytest.mark.asyncio
+async def test_all_nodes_busy_returns_429():
+    replicas = {name: create_replica(name, status_code=429) for name in ("a", "b")}
+    router = create_test_router(replicas)
+
+    async with httpx.AsyncClient(app=router, base_url="http://router") as client:
+        response = await client.post("/ner", json=decision("1"))
+
+    assert response.status_code == 429
+
+
+@pytest.mark.asyncio
+async def test_unreachable_node_fails_over():
+    router = create_router(
+        {
+            "a": unreachable_client(),
+            "b": httpx.AsyncClient(app=create_replica("b"), base_url="http://b"),
+        }
+    )
+
+    async with httpx.AsyncClient(app=router, base_url="http://router") as client:
+        for index in range(10):
+            response = await client.post("/ner", json=decision(str(index)))
+            assert response.status_code == 200
+        health = (await client.get("/")).json()
+
+    assert health["nodes"]["a"]["healthy"] is False
+    assert health["nodes"]["b"]["healthy"] is True
+
+
+@pytest.mark.asyncio
+async def test_no_node_available_returns_503():
+    router = create_router({"a": unreachable_client()})
+
+    async with httpx.AsyncClient(app=router, base_url="http://router") as client:
+        response = await client.post("/ner", json=decision("1"))
+
+    assert response.status_code == 503
+
+
+@pytest.mark.asyncio
+async def test_queue_depth_aware_routing():
+    release = asyncio.Event()
+    replicas = {name: create_replica(name, release=release) for name in ("a", "b")}
+    router = create_test_router(replicas)
+    ring = HashRing(["a", "b"])
+    first = "0"
+    owner = next(ring.iter_nodes(first))
+    # Another document owned by the same node
+    second = next(str(index) for index in range(1, 100) if next(ring.iter_nodes(str(index))) == owner)
+
+    async with httpx.AsyncClient(app=router, base_url="http://router") as client:
+        calls = [
+            asyncio.create_task(client.post("/ner", json=decision(first))),
+        ]
+        while not replicas[owner].state.calls:
+            await asyncio.sleep(0.01)
+        calls.append(asyncio.create_task(client.post("/ner", json=decision(second))))
+        calls.append(asyncio.create_task(client.post("/ner", json=decision(first))))
+        await asyncio.sleep(0.05)
+        release.set()
+        responses = await asyncio.gather(*calls)
+
+    other = ({"a", "b"} - {owner}).pop()
+    assert responses[0].json()["node"] == owner
+    # The owner is busy with another document
+    assert responses[1].json()["node"] == other
+    # The owner is busy with the same document, the request may be coalesced there
+    assert responses[2].json()["node"] == owner
+
+
+@pytest.mark.asyncio
+async def test_timed_out_node_fails_over():
+    router = create_router(
+        {
+            "a": unreachable_client(httpx.ConnectTimeout),
+            "b": httpx.AsyncClient(app=create_replica("b"), base_url="http://b"),
+        }
+    )
+
+    async with httpx.AsyncClient(app=router, base_url="http://router") as client:
+        for index in range(10):
+            response = await client.post("/ner", json=decision(str(index)))
+            assert response.status_code == 200
+            assert response.json()["node"] == "b"
+        health = (await client.get("/")).json()
+
+    assert health["nodes"]["a"]["healthy"] is False
+
+
+@pytest.mark.asyncio
+async def test_probes_detect_hanging_node():
+    replicas = {"a": create_replica("a", hang=True), "b": create_replica("b")}
+    router = create_test_router(replicas, health_timeout=0.05)
+
+    async with httpx.AsyncClient(app=router, base_url="http://router") as client:
+        health = (await client.get("/")).json()
+        assert health["nodes"]["a"] == {"healthy": True, "checked": False, "queue_depth": 0}
+
+        await router.state.probe_nodes()
+        health = (await client.get("/")).json()
+        for index in range(10):
+            response = await client.post("/ner", json=decision(str(index)))
+            assert response.json()["node"] == "b"
+
+    assert health["nodes"]["a"]["healthy"] is False
+    assert health["nodes"]["b"] == {"healthy": True, "checked": True, "queue_depth": 0}
+
+
+@pytest.mark.asyncio
+async def test_probe_does_not_end_request_cooldown():
+    def health_only(request):
+        if request.method == "GET" and request.url.path == "/":
+            return httpx.Response(200, json={"status-code": 200})
+        raise httpx.ReadError("Connection reset", request=request)
+
+    router = create_router(
+        {
+            "a": httpx.AsyncClient(transport=httpx.MockTransport(health_only), base_url="http://a"),
+            "b": httpx.AsyncClient(app=create_replica("b"), base_url="http://b"),
+        },
+        cooldown=0.2,
+    )
+
+    async with httpx.AsyncClient(app=router, base_url="http://router") as client:
+        for index in range(10):
+            response = await client.post("/ner", json=decision(str(index)))
+            assert response.json()["node"] == "b"
+
+        # The health endpoint answers but /ner failed, the cooldown still applies
+        await router.state.probe_nodes()
+        assert (await client.get("/")).json()["nodes"]["a"]["healthy"] is False
+
+        await asyncio.sleep(0.25)
+        await router.state.probe_nodes()
+        assert (await client.get("/")).json()["nodes"]["a"]["healthy"] is True
@@ -0,0 +1,122 @@
+import os
+
+import pytest
+
+from topology import (
+    get_available_cpus,
+    get_cgroup_cpu_limit,
+    get_cgroup_paths,
+    get_cpu_topology,
+    get_thread_environment,
+    partition_cpus,
+)
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as file:
+        file.write(content)
+
+
+def test_cgroup_paths(tmp_path):
+    write(
+        tmp_path / "cgroup",
+        "12:cpu,cpuacct:/system.slice/nlp-api.service\n"
+        "11:memory:/system.slice/nlp-api.service\n"
+        "0::/system.slice/nlp-api.service\n",
+    )
+
+    assert get_cgroup_paths(str(tmp_path / "cgroup")) == (
+        "/system.slice/nlp-api.service",
+        "/system.slice/nlp-api.service",
+    )
+    assert get_cgroup_paths(str(tmp_path / "missing")) == ("/", "/")
+
+
+def test_cgroup_v2_limit(tmp_path):
+    proc_cgroup = str(tmp_path / "missing")
+    write(tmp_path / "cpu.max", "250000 100000\n")
+    assert get_cgroup_cpu_limit(str(tmp_path), proc_cgroup) == 2.5
+
+    write(tmp_path / "cpu.max", "max 100000\n")
+    assert get_cgroup_cpu_limit(str(tmp_path), proc_cgroup) is None
+
+
+def test_cgroup_v2_nested_limit(tmp_path):
+    root = tmp_path / "sys"
+    write(tmp_path / "cgroup", "0::/system.slice/nlp-api.service\n")
+    write(root / "cpu.max", "max 100000\n")
+    write(root / "system.slice" / "cpu.max", "800000 100000\n")
+    write(root / "system.slice" / "nlp-api.service" / "cpu.max", "300000 100000\n")
+    assert get_cgroup_cpu_limit(str(root), str(tmp_path / "cgroup")) == 3
+
+    # The quota of a parent also applies
+    write(root / "system.slice" / "nlp-api.service" / "cpu.max", "max 100000\n")
+    assert get_cgroup_cpu_limit(str(root), str(tmp_path / "cgroup")) == 8
+
+
+def test_cgroup_v1_limit(tmp_path):
+    proc_cgroup = str(tmp_path / "missing")
+    write(tmp_path / "cpu" / "cpu.cfs_quota_us", "400000\n")
+    write(tmp_path / "cpu" / "cpu.cfs_period_us", "100000\n")
+    assert get_cgroup_cpu_limit(str(tmp_path), proc_cgroup) == 4
+
+    write(tmp_path / "cpu" / "cpu.cfs_quota_us", "-1\n")
+    assert get_cgroup_cpu_limit(str(tmp_path), proc_cgroup) is None
+
+
+def test_cgroup_v1_nested_limit(tmp_path):
+    root = tmp_path / "sys"
+    write(tmp_path / "cgroup", "4:cpu,cpuacct:/docker/0123abcd\n")
+    write(root / "cpu" / "docker" / "0123abcd" / "cpu.cfs_quota_us", "150000\n")
+    write(root / "cpu" / "docker" / "0123abcd" / "cpu.cfs_period_us", "100000\n")
+    assert get_cgroup_cpu_limit(str(root), str(tmp_path / "cgroup")) == 1.5
+
+
+def test_no_cgroup_limit(tmp_path):
+    assert get_cgroup_cpu_limit(str(tmp_path), str(tmp_path / "missing")) is None
+
+
+def test_cpu_topology(tmp_path):
+    for cpu, (package, core) in {0: (0, 0), 1: (0, 1), 2: (0, 0), 3: (0, 1)}.items():
+        write(tmp_path / f"cpu{cpu}" / "topology" / "physical_package_id", f"{package}\n")
+        write(tmp_path / f"cpu{cpu}" / "topology" / "core_id", f"{core}\n")
+
+    assert get_cpu_topology([0, 1, 2, 3], str(tmp_path)) == {
+        0: (0, 0),
+        1: (0, 1),
+        2: (0, 0),
+        3: (0, 1),
+    }
+    assert get_cpu_topology([4], str(tmp_path)) == {4: (0, 4)}
+
+
+def test_available_cpus_respect_quota(tmp_path):
+    write(tmp_path / "cpu.max", "100000 100000\n")
+    cpus = get_available_cpus(
+        cgroup_root=str(tmp_path),
+        sysfs_root=str(tmp_path),
+        proc_cgroup=str(tmp_path / "missing"),
+    )
+
+    assert len(cpus) == 1
+    assert set(cpus) <= os.sched_getaffinity(0)
+
+
+def test_partition_cpus():
+    assert partition_cpus([0, 1, 2, 3, 4], 2) == [[0, 1, 2], [3, 4]]
+    assert partition_cpus([0, 1, 2, 3], 4) == [[0], [1], [2], [3]]
+    assert partition_cpus([0, 2, 1, 3], 1) == [[0, 2, 1, 3]]
+
+    with pytest.raises(ValueError):
+        partition_cpus([0, 1], 3)
+    with pytest.raises(ValueError):
+        partition_cpus([0, 1], 0)
+
+
+def test_thread_environment():
+    assert get_thread_environment([2, 3]) == {
+        "OMP_NUM_THREADS": "2",
+        "MKL_NUM_THREADS": "2",
+        "OPENBLAS_NUM_THREADS": "2",
+    }
@@ -0,0 +1,193 @@
+import time
+import threading
+
+import pytest
+from flair.data import Sentence
+from flair.tokenization import Tokenizer
+
+from utils import RecordingTokenizer, SingleFlight, TTLCache
+
+
+class FakeTokenizer(Tokenizer):
+    def __init__(self):
+        self.calls = 0
+
+    def tokenize(self, text):
+        return text.split()
+
+    def get_tokenized_sentences(self, text, *args):
+        self.calls += 1
+        return [Sentence(text)]
+
+
+def tokens(sentences):
+    return [
+        [(token.text, token.start_position, token.end_position) for token in sentence]
+        for sentence in sentences
+    ]
+
+
+def run_concurrently(single_flight, keys, fn):
+    """Call `do` for every key, the first call blocking in `fn` until the others are waiting"""
+    started = threading.Event()
+    release = threading.Event()
+    results = [None] * len(keys)
+
+    def leader_fn():
+        started.set()
+        release.wait(timeout=5)
+        return fn()
+
+    def call(index, key, function):
+        try:
+            results[index] = single_flight.do(key, function)
+        except Exception as exc:
+            results[index] = exc
+
+    threads = [threading.Thread(target=call, args=(0, keys[0], leader_fn))]
+    threads[0].start()
+    assert started.wait(timeout=5)
+    for index, key in enumerate(keys[1:], start=1):
+        threads.append(threading.Thread(target=call, args=(index, key, fn)))
+        threads[-1].start()
+    # Let the other calls reach `do` before the first one completes
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join(timeout=5)
+    return results
+
+
+def test_single_flight_coalesces_concurrent_calls():
+    single_flight = SingleFlight()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        return {"entities": []}
+
+    results = run_concurrently(single_flight, ["decision"] * 5, fn)
+
+    assert len(calls) == 1
+    assert results[0] == ({"entities": []}, False)
+    assert results[1:] == [({"entities": []}, True)] * 4
+    assert single_flight._calls == {}
+
+    # Nothing is kept once the computation is over
+    assert single_flight.do("decision", fn) == ({"entities": []}, False)
+    assert len(calls) == 2
+
+
+def test_single_flight_shares_exceptions():
+    single_flight = SingleFlight()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        raise ValueError("busy")
+
+    results = run_concurrently(single_flight, ["decision"] * 3, fn)
+
+    assert len(calls) == 1
+    assert all(isinstance(result, ValueError) for result in results)
+    assert single_flight._calls == {}
+
+    with pytest.raises(ValueError):
+        single_flight.do("decision", fn)
+    assert len(calls) == 2
+
+
+def test_single_flight_does_not_coalesce_different_keys():
+    single_flight = SingleFlight()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        return len(calls)
+
+    results = run_concurrently(single_flight, ["a", "b", "c"], fn)
+
+    assert len(calls) == 3
+    assert all(shared is False for _, shared in results)
+    assert single_flight._calls == {}
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_ttl_cache_expires_entries():
+    cache = TTLCache(maxsize=2, ttl=0.01)
+    cache.set("a", 1)
+    time.sleep(0.02)
+
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_ttl_cache_disabled():
+    cache = TTLCache(maxsize=0, ttl=60)
+    cache.set("a", 1)
+
+    assert cache.get("a") is None
+
+
+def test_recording_tokenizer_reuses_outputs():
+    tokenizer = FakeTokenizer()
+    memo = {}
+    first = RecordingTokenizer(tokenizer, memo).get_tokenized_sentences("Pierre Dupont, ingénieur")
+    first[0][0].add_label("ner", "personnePhysique")
+    second_tokenizer = RecordingTokenizer(tokenizer, memo)
+    second = second_tokenizer.get_tokenized_sentences("Pierre Dupont, ingénieur")
+
+    assert tokens(second) == tokens(first)
+    assert second[0].to_original_text() == "Pierre Dupont, ingénieur"
+    assert not second[0][0].get_labels("ner")
+    assert tokenizer.calls == 1
+    assert second_tokenizer.hits == 1
+
+    second_tokenizer.get_tokenized_sentences("Paul Martin")
+    assert tokenizer.calls == 2
+    assert list(memo) == ["Pierre Dupont, ingénieur", "Paul Martin"]
+
+
+def test_read_only_recording_tokenizer():
+    tokenizer = FakeTokenizer()
+    memo = {}
+    RecordingTokenizer(tokenizer, memo).get_tokenized_sentences("Pierre Dupont")
+    read_only_tokenizer = RecordingTokenizer(tokenizer, memo, read_only=True)
+
+    assert tokens(read_only_tokenizer.get_tokenized_sentences("Pierre Dupont")) == [
+        [("Pierre", 0, 6), ("Dupont", 7, 13)]
+    ]
+    read_only_tokenizer.get_tokenized_sentences("Paul Martin")
+    assert read_only_tokenizer.hits == 1
+    assert tokenizer.calls == 2
+    assert list(memo) == ["Pierre Dupont"]
+
+
+def test_recording_tokenizer_delegates_other_calls():
+    tokenizer = FakeTokenizer()
+    memo = {}
+    recording_tokenizer = RecordingTokenizer(tokenizer, memo)
+
+    recording_tokenizer.get_tokenized_sentences("Pierre Dupont", "option")
+    assert recording_tokenizer.calls == 1
+    assert memo == {}
+
+
+def test_recording_tokenizer_is_a_flair_tokenizer():
+    recording_tokenizer = RecordingTokenizer(FakeTokenizer(), {})
+
+    assert isinstance(recording_tokenizer, Tokenizer)
+    assert recording_tokenizer.name == "FakeTokenizer"
+    sentence = Sentence("Pierre Dupont", use_tokenizer=recording_tokenizer)
+    assert [token.text for token in sentence] == ["Pierre", "Dupont"]
@@ -0,0 +1,166 @@
+import os
+import math
+
+THREAD_ENV_VARIABLES = (
+    "OMP_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+)
+
+
+def get_cgroup_paths(proc_cgroup: str = "/proc/self/cgroup") -> tuple[str, str]:
+    """Get the cgroup of the process, in the v2 hierarchy and in the v1 cpu hierarchy"""
+    unified, cpu = "/", "/"
+    try:
+        with open(proc_cgroup) as cgroups:
+            lines = cgroups.read().splitlines()
+    except OSError:
+        return unified, cpu
+    for line in lines:
+        _, controllers, path = line.split(":", 2)
+        if not controllers:
+            unified = path
+        elif "cpu" in controllers.split(","):
+            cpu = path
+    return unified, cpu
+
+
+def _iter_cgroup_directories(hierarchy: str, path: str):
+    """Yields the directory of a cgroup, then the ones of its parents"""
+    parts = [part for part in path.split("/") if part]
+    for depth in range(len(parts), -1, -1):
+        yield os.path.join(hierarchy, *parts[:depth])
+
+
+def _read_cgroup_v2_limit(directory: str):
+    with open(os.path.join(directory, "cpu.max")) as cpu_max:
+        quota, period = cpu_max.read().split()[:2]
+    if quota == "max":
+        return None
+    return int(quota) / int(period)
+
+
+def _read_cgroup_v1_limit(directory: str):
+    with open(os.path.join(directory, "cpu.cfs_quota_us")) as cfs_quota:
+        quota = int(cfs_quota.read())
+    with open(os.path.join(directory, "cpu.cfs_period_us")) as cfs_period:
+        period = int(cfs_period.read())
+    if quota <= 0 or period <= 0:
+        return None
+    return quota / period
+
+
+def get_cgroup_cpu_limit(
+    cgroup_root: str = "/sys/fs/cgroup",
+    proc_cgroup: str = "/proc/self/cgroup",
+):
+    """Get the number of CPUs allowed by the cgroup quotas of the process, v2 or v1
+
+    The quota of the cgroup of the process and the ones of its parents all apply,
+    the smallest one is kept.
+
+    Returns:
+        float: CPU quota divided by its period, None if there is no quota
+    """
+    unified, cpu = get_cgroup_paths(proc_cgroup)
+    directories = [
+        (_read_cgroup_v2_limit, directory)
+        for directory in _iter_cgroup_directories(cgroup_root, unified)
+    ] + [
+        (_read_cgroup_v1_limit, directory)
+        for directory in _iter_cgroup_directories(os.path.join(cgroup_root, "cpu"), cpu)
+    ]
+
+    limits = []
+    for read_limit, directory in directories:
+        try:
+            limit = read_limit(directory)
+        except (OSError, ValueError):
+            continue
+        if limit is not None:
+            limits.append(limit)
+    return min(limits, default=None)
+
+
+def get_cpu_topology(cpus: list[int], sysfs_root: str = "/sys/devices/system/cpu") -> dict:
+    """Get the (package, core) of each CPU, CPUs sharing a core being hyperthreads"""
+    topology = {}
+    for cpu in cpus:
+        path = os.path.join(sysfs_root, f"cpu{cpu}", "topology")
+        try:
+            with open(os.path.join(path, "physical_package_id")) as package_id:
+                package = int(package_id.read())
+            with open(os.path.join(path, "core_id")) as core_id:
+                core = int(core_id.read())
+        except (OSError, ValueError):
+            package, core = 0, cpu
+        topology[cpu] = (package, core)
+    return topology
+
+
+def get_available_cpus(
+    cgroup_root: str = "/sys/fs/cgroup",
+    sysfs_root: str = "/sys/devices/system/cpu",
+    proc_cgroup: str = "/proc/self/cgroup",
+) -> list[int]:
+    """Get the CPUs usable by the process, in topology order and within the cgroup quota"""
+    cpus = sorted(os.sched_getaffinity(0))
+    topology = get_cpu_topology(cpus, sysfs_root=sysfs_root)
+    cpus.sort(key=lambda cpu: (*topology[cpu], cpu))
+
+    limit = get_cgroup_cpu_limit(cgroup_root, proc_cgroup=proc_cgroup)
+    if limit is not None:
+        cpus = cpus[: max(1, math.ceil(limit))]
+    return cpus
+
+
+def partition_cpus(cpus: list[int], workers: int) -> list[list[int]]:
+    """Split CPUs into `workers` contiguous groups of near-equal size
+
+    Contiguous groups of CPUs in topology order keep the hyperthreads of a core
+    and the cores of a package in the same worker.
+    """
+    if workers < 1:
+        raise ValueError("At least one worker is needed")
+    if workers > len(cpus):
+        raise ValueError(f"Cannot split {len(cpus)} CPUs among {workers} workers")
+
+    size, remainder = divmod(len(cpus), workers)
+    partitions = []
+    start = 0
+    for worker in range(workers):
+        end = start + size + (worker < remainder)
+        partitions.append(cpus[start:end])
+        start = end
+    return partitions
+
+
+def get_thread_environment(cpus: list[int]) -> dict[str, str]:
+    """Get the environment variables limiting OpenMP/MKL/BLAS thread pools to `cpus`"""
+    return {variable: str(len(cpus)) for variable in THREAD_ENV_VARIABLES}
+
+
+def pin_worker(cpus: list[int]) -> dict:
+    """Pin the current process to `cpus` and size its thread pools accordingly
+
+    The thread environment variables are only read when the libraries start and
+    the inter-op threads can only be set before any parallel work, so this must
+    be called before torch, spaCy or the app are imported.
+
+    Returns:
+        dict: layout of the worker
+    """
+    os.sched_setaffinity(0, cpus)
+    os.environ.update(get_thread_environment(cpus))
+
+    import torch
+
+    torch.set_num_threads(len(cpus))
+    torch.set_num_interop_threads(1)
+
+    return {
+        "pid": os.getpid(),
+        "cpus": sorted(os.sched_getaffinity(0)),
+        "torch_threads": torch.get_num_threads(),
+        "torch_interop_threads": torch.get_num_interop_threads(),
+    }
@@ -1,9 +1,16 @@
 import pkg_resources
 from pkg_resources import Requirement
 import os
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
 from datetime import datetime
 from juritools.main import ner
 from juritools.type import Decision
+from flair.data import Sentence, Token
+from flair.tokenization import Tokenizer
 from flair.models import SequenceTagger
 from jurispacy_tokenizer import JuriSpacyTokenizer
 import config
@@ -36,3 +43,146 @@ def process_ner(
     except Exception as exc:
         config.processing_request = False
         raise exc
+
+
+def get_decision_hash(decision: Decision) -> str:
+    "Get a hash identifying the whole content of a decision"
+    return hashlib.sha256(decision.model_dump_json().encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    """Coalesce concurrent calls sharing the same key into a single computation.
+
+    The first caller for a key runs the function, callers arriving while it is
+    still running wait for it and get the same result (or exception).
+    Nothing is kept once the computation is over.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: dict[str, Future] = {}
+
+    def do(self, key: str, fn, *args, **kwargs):
+        """Run `fn` for `key` unless an identical call is in flight
+
+        Returns:
+            tuple: the result of `fn` and whether it was shared with another call
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+
+        if not leader:
+            return future.result(), True
+
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+class TTLCache:
+    """Thread-safe LRU store whose entries expire after `ttl` seconds"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: OrderedDict = OrderedDict()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+def snapshot_sentences(sentences: list[Sentence]) -> list[tuple]:
+    """Get the tokens of sentences as tuples, much cheaper to keep than the sentences"""
+    return [
+        (
+            sentence.start_position,
+            [(token.text, token.whitespace_after, token.start_position) for token in sentence],
+        )
+        for sentence in sentences
+    ]
+
+
+def restore_sentences(snapshot: list[tuple]) -> list[Sentence]:
+    """Rebuild unlabelled sentences from a snapshot"""
+    return [
+        Sentence(
+            [
+                Token(text, whitespace_after=whitespace_after, start_position=token_start)
+                for text, whitespace_after, token_start in tokens
+            ],
+            start_position=sentence_start,
+        )
+        for sentence_start, tokens in snapshot
+    ]
+
+
+class RecordingTokenizer(Tokenizer):
+    """Tokenizer proxy memoizing `get_tokenized_sentences` by text
+
+    A snapshot of the sentences of each text is stored in `memo`, so that a later
+    proxy built on the same `memo` rebuilds them instead of tokenizing the same
+    text again. A read-only proxy does not store the texts it tokenizes.
+    """
+
+    def __init__(self, tokenizer: JuriSpacyTokenizer, memo: dict, read_only: bool = False):
+        self._tokenizer = tokenizer
+        self.memo = memo
+        self.read_only = read_only
+        self.hits = 0
+
+    def __getattr__(self, name):
+        return getattr(self._tokenizer, name)
+
+    @property
+    def name(self) -> str:
+        return self._tokenizer.name
+
+    def tokenize(self, text: str) -> list[str]:
+        return self._tokenizer.tokenize(text)
+
+    def get_tokenized_sentences(self, text: str, *args, **kwargs):
+        # Options may change the tokenization, only plain calls are memoized
+        if args or kwargs:
+            return self._tokenizer.get_tokenized_sentences(text, *args, **kwargs)
+        if text in self.memo:
+            self.hits += 1
+            return restore_sentences(self.memo[text])
+        sentences = self._tokenizer.get_tokenized_sentences(text)
+        if not self.read_only:
+            self.memo[text] = snapshot_sentences(sentences)
+        return sentences